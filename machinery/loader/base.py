@@ -1,15 +1,21 @@
 import os
 import re
-from typing import List, Tuple
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing.context import BaseContext
+from typing import Iterator, List, Tuple
 
 import numpy as np
 import pandas as pd
 from loguru import logger
+from openpyxl import load_workbook
 from pandas import DataFrame
 from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 
 from machinery.dataset.downloader import download_data
+from machinery.loader.cache import parsed_cache
 
 metallicadour_cols = [
     "Case",
@@ -30,6 +36,16 @@ standard_cols = [
     "Speed",
     "Filepath",
 ]
+data_num_cols = {
+    "laspi": 7,
+    "ampere_rotor": 11,
+    "ampere_stator": 11,
+    "metallicadour_toolwear": 12,
+    "metallicadour_drifts": 12,
+}
+
+# number of bytes read at the beginning of a CSV file to estimate its number of rows
+header_sample_size = 65536
 
 
 def load_metadata(
@@ -126,104 +142,585 @@ def load_metadata(
     return metadata_df, class_mapping
 
 
-def load_csv_data(filepaths: List[str], num_cols: int) -> np.ndarray:
+def read_file_header(filepath: str) -> Tuple[List[str], int]:
     """
-    Load data from CSV or Excel files and preprocess.
+    Read the header of a CSV or Excel file without parsing its content.
 
     Args:
-        filepaths (List[str]): List of file paths to load.
-        num_cols (int): Expected number of columns in each file.
+        filepath (str): Path of the file.
 
     Returns:
-        np.ndarray: Numpy array containing the loaded and preprocessed data.
+        Tuple[List[str], int]: A tuple containing the column names and the estimated number of rows.
     """
-    data = []
+    if str(filepath).endswith(".csv"):
+        file_size = os.path.getsize(filepath)
+        with open(filepath, "rb") as file:
+            sample = file.read(header_sample_size)
+        lines = sample.splitlines()
+        columns = pd.read_csv(filepath, encoding="utf-8", nrows=0).columns.tolist()
+
+        if len(sample) >= file_size:
+            # The whole file is in the sample, count rows exactly
+            estimated_rows = len([line for line in lines[1:] if line.strip()])
+        else:
+            # Drop the header and the last (possibly truncated) line
+            data_lines = lines[1:-1]
+            if not data_lines:
+                estimated_rows = 0
+            else:
+                header_bytes = sample.index(b"\n") + 1
+                bytes_per_row = (
+                    sum(len(line) for line in data_lines) / len(data_lines) + 1
+                )
+                estimated_rows = int((file_size - header_bytes) / bytes_per_row)
 
-    # parameter used for data with different number of rows among files
-    min_rows = float("inf")
+    # METALLICADOUR drifts positions
+    elif str(filepath).endswith(".xlsx"):
+        workbook = load_workbook(filepath, read_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            columns = [str(column) for column in header]
+            estimated_rows = max(sheet.max_row - 1, 0) if sheet.max_row else 0
+        finally:
+            workbook.close()
+
+    else:
+        raise Exception("File format not accepted. Use CSV/XLSX format.")
+
+    return columns, estimated_rows
+
+
+def validate_files(
+    filepaths: List[str],
+    num_cols: int,
+    column_names: List[str] = None,
+    max_workers: int = None,
+) -> DataFrame:
+    """
+    Validate files against the dataset schema by reading only their header.
+
+    Headers are read in parallel. All the errors are collected and raised together before any full parse.
+
+    Args:
+        filepaths (List[str]): List of file paths to validate.
+        num_cols (int): Expected number of columns in each file.
+        column_names (List[str], optional): Expected column names. Defaults to None, in which case
+            the column names of the first file are used as reference.
+        max_workers (int, optional): Number of threads used to read the headers. Defaults to None.
+
+    Returns:
+        DataFrame: A DataFrame with the columns Filepath, File_Size, File_Mtime, Estimated_Rows and Validated.
+    """
 
-    for filepath in tqdm(filepaths):
+    def read_header(filepath: str) -> Tuple[List[str], int, os.stat_result]:
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"File not found: {filepath}")
+        # Stat before reading so a file modified during the validation is seen as stale
+        stat = os.stat(filepath)
+        try:
+            columns, estimated_rows = read_file_header(filepath)
+        except Exception as e:
+            raise Exception(
+                f"Error while reading header of file: {filepath}, with error: {e}"
+            )
+        return columns, estimated_rows, stat
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(read_header, filepath) for filepath in filepaths]
 
+    errors = []
+    headers = []
+    for filepath, future in zip(filepaths, futures):
         try:
-            if str(filepath).endswith(".csv"):
-                df = pd.read_csv(filepath, encoding="utf-8")
-                if df.shape[1] != num_cols:
-                    raise ValueError(
-                        f"Inconsistent number of columns in file {filepath}. Expected: {num_cols}, Actual: {df.shape[1]}"
-                    )
+            headers.append(future.result())
+        except Exception as e:
+            errors.append(str(e))
+            headers.append(None)
 
-                # Update min_rows based on the minimum number of rows in the current file
-                min_rows = min(min_rows, df.shape[0])
+    reference_names = column_names
+    for filepath, header in zip(filepaths, headers):
+        if header is None:
+            continue
+        columns = header[0]
+        if len(columns) != num_cols:
+            errors.append(
+                f"Inconsistent number of columns in file {filepath}. Expected: {num_cols}, Actual: {len(columns)}"
+            )
+            continue
+        if reference_names is None:
+            reference_names = columns
+        elif list(columns) != list(reference_names):
+            errors.append(
+                f"Inconsistent column names in file {filepath}. Expected: {list(reference_names)}, Actual: {columns}"
+            )
 
-                data.append(df.values[:min_rows])
+    if errors:
+        raise ValueError(
+            f"{len(errors)} file(s) do not match the schema:\n" + "\n".join(errors)
+        )
 
-            # METALLICADOUR drifts positions
-            elif str(filepath).endswith(".xlsx"):
-                df = pd.read_excel(filepath)
-                if df.shape[1] != num_cols:
-                    raise ValueError(
-                        f"Inconsistent number of columns in file {filepath}. Expected: {num_cols}, Actual: {df.shape[1]}"
-                    )
+    return pd.DataFrame(
+        {
+            "Filepath": filepaths,
+            "File_Size": [header[2].st_size for header in headers],
+            "File_Mtime": [header[2].st_mtime_ns for header in headers],
+            "Estimated_Rows": [header[1] for header in headers],
+            "Validated": True,
+        }
+    )
+
+
+def validate_metadata(
+    metadata_df: DataFrame,
+    data_type: str,
+    column_names: List[str] = None,
+    max_workers: int = None,
+) -> DataFrame:
+    """
+    Validate the files of a metadata DataFrame and cache the results in it.
 
-                # Update min_rows based on the minimum number of rows in the current file
-                min_rows = min(min_rows, df.shape[0])
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame containing file paths.
+        data_type (str): Type of data ('laspi', 'ampere_rotor', 'ampere_stator', 'metallicadour_tool_wear').
+        column_names (List[str], optional): Expected column names. Defaults to None.
+        max_workers (int, optional): Number of threads used to read the headers. Defaults to None.
+
+    Returns:
+        DataFrame: A copy of the metadata DataFrame with the columns File_Size, File_Mtime, Estimated_Rows
+            and Validated. Files flagged as validated and not modified since are not checked again by load_data.
+    """
+    if data_type not in data_num_cols:
+        raise ValueError(f"data_type should be one of:  {list(data_num_cols)} ")
+
+    validation_df = validate_files(
+        metadata_df.Filepath.tolist(),
+        data_num_cols[data_type],
+        column_names=column_names,
+        max_workers=max_workers,
+    )
+    metadata_df = metadata_df.copy()
+    for col in ["File_Size", "File_Mtime", "Estimated_Rows", "Validated"]:
+        metadata_df[col] = validation_df[col].to_numpy()
+    return metadata_df
+
+
+def get_cached_file(
+    filepath: str,
+    num_cols: int,
+    validated: bool = False,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+) -> Tuple[Tuple, np.ndarray]:
+    """
+    Check that a file exists and look it up in the parsed files cache.
 
-                data.append(df.values[:min_rows])
+    Args:
+        filepath (str): Path of the file to read.
+        num_cols (int): Expected number of columns in the file.
+        validated (bool, optional): Whether the file was already validated by validate_files.
+            The existence check is skipped if True. Defaults to False.
+        dtype (np.dtype, optional): Data type of the parsed array. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
 
-            else:
-                raise Exception("File format not accepted. Use CSV/XLSX format.")
-        except Exception as e:
-            raise Exception(
-                f"Error while loading CSV/XLSX file: {filepath}, with error: {e}"
+    Returns:
+        Tuple[Tuple, np.ndarray]: The cache key (None if the cache is disabled) and the cached array
+            (None if the file is not cached).
+    """
+    if not validated and not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    if not parsed_cache.enabled:
+        return None, None
+    cache_key = parsed_cache.make_key(filepath, num_cols, dtype, channels)
+    return cache_key, parsed_cache.get(cache_key)
+
+
+def read_file(
+    filepath: str,
+    num_cols: int,
+    validated: bool = False,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+    use_cache: bool = True,
+) -> np.ndarray:
+    """
+    Read a single CSV or Excel file into a Numpy array.
+
+    If the cache is enabled (see machinery.loader.cache.enable_cache), files already parsed
+    with the same expected number of columns, dtype and channels are not parsed again.
+
+    Args:
+        filepath (str): Path of the file to read.
+        num_cols (int): Expected number of columns in the file.
+        validated (bool, optional): Whether the file was already validated by validate_files.
+            The existence and column checks are skipped if True. Defaults to False.
+        dtype (np.dtype, optional): Data type of the returned array. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+        use_cache (bool, optional): Whether to use the parsed files cache. Defaults to True.
+
+    Returns:
+        np.ndarray: Numpy array of shape (rows, channels). Arrays returned from the cache are read-only.
+    """
+    cache_key = None
+    if use_cache:
+        cache_key, values = get_cached_file(
+            filepath, num_cols, validated, dtype, channels
+        )
+        if values is not None:
+            return values
+    elif not validated and not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    # Only parse the selected columns when the schema is already known
+    usecols = channels if validated and channels is not None else None
+
+    try:
+        if str(filepath).endswith(".csv"):
+            df = pd.read_csv(filepath, encoding="utf-8", usecols=usecols)
+
+        # METALLICADOUR drifts positions
+        elif str(filepath).endswith(".xlsx"):
+            df = pd.read_excel(filepath, usecols=usecols)
+
+        else:
+            raise Exception("File format not accepted. Use CSV/XLSX format.")
+
+        if not validated and df.shape[1] != num_cols:
+            raise ValueError(
+                f"Inconsistent number of columns in file {filepath}. Expected: {num_cols}, Actual: {df.shape[1]}"
+            )
+    except Exception as e:
+        raise Exception(
+            f"Error while loading CSV/XLSX file: {filepath}, with error: {e}"
+        )
+
+    values = df.to_numpy(dtype=dtype)
+    if channels is not None:
+        if usecols is not None:
+            # usecols keeps the file order of the columns, restore the requested order
+            sorted_channels = sorted(set(channels))
+            channels = [sorted_channels.index(channel) for channel in channels]
+        values = values[:, channels]
+
+    if cache_key is not None:
+        parsed_cache.put(cache_key, values)
+    return values
+
+
+def read_files(
+    filepaths: List[str],
+    num_cols: int,
+    validated: List[bool] = None,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+) -> List[np.ndarray]:
+    """
+    Read CSV or Excel files one after another, with a progress bar.
+
+    Args:
+        filepaths (List[str]): List of file paths to read.
+        num_cols (int): Expected number of columns in each file.
+        validated (List[bool], optional): Flags of the files already validated by validate_files.
+            The existence and column checks are skipped for these files. Defaults to None.
+        dtype (np.dtype, optional): Data type of the returned arrays. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+
+    Returns:
+        List[np.ndarray]: One array of shape (rows, channels) per file.
+    """
+    if validated is None:
+        validated = [False] * len(filepaths)
+
+    return [
+        read_file(filepath, num_cols, is_validated, dtype, channels)
+        for filepath, is_validated in tqdm(
+            zip(filepaths, validated), total=len(filepaths)
+        )
+    ]
+
+
+def submit_files(
+    executor: ProcessPoolExecutor,
+    filepaths: List[str],
+    num_cols: int,
+    validated: List[bool] = None,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+) -> List[Future]:
+    """
+    Submit the parsing of CSV or Excel files to a pool of processes.
+
+    Files found in the parsed files cache are not sent to the workers, and the arrays parsed by
+    the workers are added to the cache of the current process.
+
+    Args:
+        executor (ProcessPoolExecutor): Pool of processes parsing the files.
+        filepaths (List[str]): List of file paths to read.
+        num_cols (int): Expected number of columns in each file.
+        validated (List[bool], optional): Flags of the files already validated by validate_files.
+            The existence and column checks are skipped for these files. Defaults to None.
+        dtype (np.dtype, optional): Data type of the returned arrays. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+
+    Returns:
+        List[Future]: One future per file, resolving to an array of shape (rows, channels).
+    """
+    if validated is None:
+        validated = [False] * len(filepaths)
+
+    def cache_result(cache_key: Tuple, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            parsed_cache.put(cache_key, future.result())
+
+    futures = []
+    for filepath, is_validated in zip(filepaths, validated):
+        cache_key, values = get_cached_file(
+            filepath, num_cols, is_validated, dtype, channels
+        )
+        if values is not None:
+            future = Future()
+            future.set_result(values)
+        else:
+            future = executor.submit(
+                read_file, filepath, num_cols, is_validated, dtype, channels, False
             )
+            if cache_key is not None:
+                future.add_done_callback(partial(cache_result, cache_key))
+        futures.append(future)
+    return futures
+
+
+def stack_files(data: List[np.ndarray]) -> np.ndarray:
+    """
+    Stack per-file arrays, truncated to the minimum number of rows among files.
 
-    data = [arr[:min_rows] for arr in data]
-    data = np.stack(data, axis=0)
+    Args:
+        data (List[np.ndarray]): One array of shape (rows, channels) per file.
 
-    return data
+    Returns:
+        np.ndarray: Numpy array of shape (n_files, min_rows, channels).
+    """
+    # parameter used for data with different number of rows among files
+    min_rows = min(arr.shape[0] for arr in data)
+    return np.stack([arr[:min_rows] for arr in data], axis=0)
+
+
+def load_csv_data(
+    filepaths: List[str],
+    num_cols: int,
+    validated: List[bool] = None,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+    out_path: str = None,
+) -> np.ndarray:
+    """
+    Load data from CSV or Excel files and preprocess.
 
+    Args:
+        filepaths (List[str]): List of file paths to load.
+        num_cols (int): Expected number of columns in each file.
+        validated (List[bool], optional): Flags of the files already validated by validate_files.
+            The existence and column checks are skipped for these files. Defaults to None.
+        dtype (np.dtype, optional): Data type of the returned array. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+        out_path (str, optional): If given, the data is written to a memory-mapped .npy file at this path
+            instead of being kept in memory. The file has the shape of the returned array. Defaults to None.
 
-def load_data(metadata_df: DataFrame, data_type: str) -> Tuple[np.ndarray, np.ndarray]:
+    Returns:
+        np.ndarray: Numpy array (or np.memmap if out_path is given) containing the loaded and preprocessed data.
+    """
+    if out_path is None:
+        return stack_files(read_files(filepaths, num_cols, validated, dtype, channels))
+
+    out = None
+
+    if validated is None:
+        validated = [False] * len(filepaths)
+
+    # parameter used for data with different number of rows among files
+    min_rows = float("inf")
+
+    for index, (filepath, is_validated) in enumerate(
+        tqdm(zip(filepaths, validated), total=len(filepaths))
+    ):
+        values = read_file(filepath, num_cols, is_validated, dtype, channels)
+
+        # Update min_rows based on the minimum number of rows in the current file
+        min_rows = min(min_rows, values.shape[0])
+
+        if out is None:
+            # The output never has more rows than the first file
+            out = np.lib.format.open_memmap(
+                out_path,
+                mode="w+",
+                dtype=np.float64 if dtype is None else dtype,
+                shape=(len(filepaths), values.shape[0], values.shape[1]),
+            )
+        out[index, :min_rows] = values[:min_rows]
+
+    out.flush()
+    if out.shape[1] != min_rows:
+        # Rewrite the file so that its shape on disk matches the returned array
+        fd, tmp_path = tempfile.mkstemp(
+            suffix=".npy", dir=os.path.dirname(os.path.abspath(out_path))
+        )
+        os.close(fd)
+        trimmed = np.lib.format.open_memmap(
+            tmp_path,
+            mode="w+",
+            dtype=out.dtype,
+            shape=(out.shape[0], min_rows, out.shape[2]),
+        )
+        for index in range(out.shape[0]):
+            trimmed[index] = out[index, :min_rows]
+        trimmed.flush()
+        del out, trimmed
+        os.replace(tmp_path, out_path)
+    return np.lib.format.open_memmap(out_path, mode="r+")
+
+
+def load_csv_data_parallel(
+    filepaths: List[str],
+    num_cols: int,
+    validated: List[bool] = None,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+    max_workers: int = None,
+    mp_context: BaseContext = None,
+) -> np.ndarray:
+    """
+    Load data from CSV or Excel files, parsing the files in a pool of processes.
+
+    Parsing Excel files with openpyxl holds the GIL, so threads do not speed it up.
+    With the "spawn" or "forkserver" start methods (default on macOS and Windows), the calling
+    script must be protected by an `if __name__ == "__main__":` guard.
+
+    Args:
+        filepaths (List[str]): List of file paths to load.
+        num_cols (int): Expected number of columns in each file.
+        validated (List[bool], optional): Flags of the files already validated by validate_files.
+            The existence and column checks are skipped for these files. Defaults to None.
+        dtype (np.dtype, optional): Data type of the returned array. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+        max_workers (int, optional): Number of worker processes. Defaults to None (number of CPUs).
+        mp_context (BaseContext, optional): Multiprocessing context of the pool. Defaults to None
+            (default start method of the platform).
+
+    Returns:
+        np.ndarray: Numpy array containing the loaded and preprocessed data.
+    """
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=mp_context
+    ) as executor:
+        futures = submit_files(
+            executor, filepaths, num_cols, validated, dtype, channels
+        )
+        return stack_files([future.result() for future in futures])
+
+
+def get_validated(metadata_df: DataFrame) -> [List[bool], None]:
+    """
+    Get the validation flags cached in the metadata DataFrame by validate_metadata.
+
+    A file is only considered validated if its size and modification time did not change since
+    the validation, otherwise it is checked again when loaded.
+
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame.
+
+    Returns:
+        List[bool]: Validation flags, or None if the metadata was not validated.
+    """
+    validation_cols = ["Validated", "File_Size", "File_Mtime"]
+    if not all(col in metadata_df.columns for col in validation_cols):
+        return None
+
+    validated = []
+    for filepath, is_validated, file_size, file_mtime in zip(
+        metadata_df.Filepath,
+        metadata_df["Validated"].fillna(False).astype(bool),
+        metadata_df["File_Size"],
+        metadata_df["File_Mtime"],
+    ):
+        if is_validated:
+            try:
+                stat = os.stat(filepath)
+                is_validated = (
+                    stat.st_size == file_size and stat.st_mtime_ns == file_mtime
+                )
+            except OSError:
+                is_validated = False
+        validated.append(bool(is_validated))
+    return validated
+
+
+def load_data(
+    metadata_df: DataFrame,
+    data_type: str,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+    out_path: str = None,
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Load data from CSV files specified in the metadata DataFrame and return NumPy arrays.
 
     Args:
         metadata_df (DataFrame): The metadata DataFrame containing file paths and class information.
         data_type (str): Type of data ('laspi', 'ampere_rotor', 'ampere_stator', 'metallicadour_tool_wear').
+        dtype (np.dtype, optional): Data type of the returned array. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+        out_path (str, optional): If given, the data is written to a memory-mapped .npy file. Defaults to None.
 
     Returns:
         Tuple[np.ndarray, np.ndarray]: A tuple containing data (X) as a NumPy array and labels (y) as a NumPy array.
 
     """
-    accepted_data_type = [
-        "laspi",
-        "ampere_rotor",
-        "ampere_stator",
-        "metallicadour_toolwear",
-        "metallicadour_drifts",
-    ]
+    accepted_data_type = list(data_num_cols)
     if data_type not in accepted_data_type:
         raise ValueError(f"data_type should be one of:  {accepted_data_type} ")
 
     filepaths = metadata_df.Filepath.tolist()
     y = metadata_df["class"].to_numpy()
-    map_num_cols = {
-        "laspi": 7,
-        "ampere_rotor": 11,
-        "ampere_stator": 11,
-        "metallicadour_toolwear": 12,
-        "metallicadour_drifts": 12,
-    }
 
-    num_cols = map_num_cols[data_type]
+    num_cols = data_num_cols[data_type]
+
+    # Files validated by validate_metadata are not checked again
+    validated = get_validated(metadata_df)
 
-    data = load_csv_data(filepaths, num_cols)
+    data = load_csv_data(filepaths, num_cols, validated, dtype, channels, out_path)
 
     return data, y
 
 
+def iter_data(
+    metadata_df: DataFrame,
+    data_type: str,
+    batch_size: int = 32,
+    dtype: np.dtype = None,
+    channels: List[int] = None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Stream data from CSV files specified in the metadata DataFrame by batches of files.
+
+    Each batch is truncated to the minimum number of rows of its own files.
+
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame containing file paths and class information.
+        data_type (str): Type of data ('laspi', 'ampere_rotor', 'ampere_stator', 'metallicadour_tool_wear').
+        batch_size (int, optional): Number of files per batch. Defaults to 32.
+        dtype (np.dtype, optional): Data type of the returned arrays. Defaults to None.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: A tuple containing a batch of data (X) and the corresponding labels (y).
+    """
+    for start in range(0, len(metadata_df), batch_size):
+        yield load_data(
+            metadata_df.iloc[start : start + batch_size], data_type, dtype, channels
+        )
+
+
 def split_metadata(
     metadata_df: pd.DataFrame,
     group_by_cols: [str] = None,
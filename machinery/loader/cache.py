@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+
+
+class ParsedArrayCache:
+    """
+    Thread-safe LRU cache of parsed per-file arrays, bounded by the total size of the arrays.
+
+    Entries are keyed by file path, modification time, expected number of columns, dtype and
+    channel selection, so a modified file is parsed again. The cache is disabled while max_bytes is 0.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(
+        filepath: str,
+        num_cols: int,
+        dtype: np.dtype = None,
+        channels: List[int] = None,
+    ) -> Tuple:
+        """
+        Build the cache key of a file.
+
+        Args:
+            filepath (str): Path of the file.
+            num_cols (int): Expected number of columns in the file.
+            dtype (np.dtype, optional): Data type of the parsed array. Defaults to None.
+            channels (List[int], optional): Indices of the selected columns. Defaults to None.
+
+        Returns:
+            Tuple: The cache key.
+        """
+        return (
+            os.path.abspath(filepath),
+            os.stat(filepath).st_mtime_ns,
+            num_cols,
+            None if dtype is None else np.dtype(dtype).str,
+            None if channels is None else tuple(channels),
+        )
+
+    def get(self, key: Tuple) -> [np.ndarray, None]:
+        """
+        Get a cached array and mark it as the most recently used.
+
+        Args:
+            key (Tuple): The cache key, see make_key.
+
+        Returns:
+            np.ndarray: The cached read-only array, or None if the key is not cached.
+        """
+        with self._lock:
+            values = self._entries.get(key)
+            if values is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return values
+
+    def put(self, key: Tuple, values: np.ndarray) -> None:
+        """
+        Cache an array, evicting the least recently used entries if needed.
+
+        The array is made read-only. Arrays larger than max_bytes are not cached.
+
+        Args:
+            key (Tuple): The cache key, see make_key.
+            values (np.ndarray): The parsed array.
+        """
+        if values.nbytes > self.max_bytes:
+            return
+        # Cached arrays are shared between calls, they must not be modified
+        values.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = values
+            self.current_bytes += values.nbytes
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        """
+        Change the maximum size of the cache, evicting the least recently used entries if needed.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached arrays. 0 disables the cache.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        # Remove the least recently used entries until the cache fits in max_bytes
+        while self._entries and self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        """
+        Remove all the cached arrays and reset the hit and miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        """
+        Get the statistics of the cache.
+
+        Returns:
+            dict: A dictionary with the keys hits, misses, entries, current_bytes and max_bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+parsed_cache = ParsedArrayCache()
+
+
+def enable_cache(max_bytes: int = 2 * 1024**3) -> None:
+    """
+    Enable the in-memory cache of parsed files used by load_csv_data.
+
+    Args:
+        max_bytes (int, optional): Maximum total size of the cached arrays. Defaults to 2 GB.
+    """
+    if max_bytes <= 0:
+        raise ValueError("max_bytes must be positive")
+    parsed_cache.resize(max_bytes)
+
+
+def disable_cache() -> None:
+    """
+    Disable the in-memory cache of parsed files and release the cached arrays.
+    """
+    parsed_cache.resize(0)
+    parsed_cache.clear()
+
+
+def cache_clear() -> None:
+    """
+    Remove all the cached arrays and reset the hit and miss counters.
+    """
+    parsed_cache.clear()
+
+
+def cache_info() -> dict:
+    """
+    Get the statistics of the in-memory cache of parsed files.
+
+    Returns:
+        dict: A dictionary with the keys hits, misses, entries, current_bytes and max_bytes.
+    """
+    return parsed_cache.info()
@@ -1,8 +1,12 @@
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.context import BaseContext
 from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
+from loguru import logger
 from numpy import ndarray
 from pandas import DataFrame
 
@@ -11,9 +15,14 @@ from machinery.dataset.variables import (
     METALLICADOUR_POSITION_PATH,
 )
 from machinery.loader.base import (
+    data_num_cols,
+    get_validated,
     load_data,
     load_metadata,
     load_split_data,
+    read_files,
+    stack_files,
+    submit_files,
 )
 
 
@@ -160,3 +169,231 @@ def load_drifts_data(
         metadata_df, "metallicadour_drifts"
     )
     return metallicadour_drift_data, metallicadour_drift_target
+
+
+def get_case_dir(filepath: str, folder_name: str) -> str:
+    """
+    Get the case directory of a METALLICADOUR drifts file.
+
+    Args:
+        filepath (str): Path of the tool CSV or position XLSX file.
+        folder_name (str): Name of the stream folder inside the case directory
+            (METALLICADOUR_DATA_PATH or METALLICADOUR_POSITION_PATH).
+
+    Returns:
+        str: Path of the case directory containing the stream folder.
+    """
+    path = os.path.dirname(os.path.abspath(filepath))
+    while True:
+        if os.path.basename(path) == folder_name:
+            return os.path.dirname(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            # Folder not found in the path, fall back on the layout used by get_files_paths_metadata
+            return os.path.dirname(os.path.dirname(os.path.abspath(filepath)))
+        path = parent
+
+
+def pair_drifts_metadata(
+    tool_metadata_df: DataFrame, position_metadata_df: DataFrame
+) -> Tuple[DataFrame, DataFrame]:
+    """
+    Pair the tool and position metadata rows belonging to the same case directory.
+
+    Files of a same case are paired in sorted order. Files without counterpart are excluded.
+
+    Args:
+        tool_metadata_df (DataFrame): Tool metadata from load_metallicadour_drifts_metadata.
+        position_metadata_df (DataFrame): Position metadata from load_metallicadour_drifts_metadata.
+
+    Returns:
+        Tuple[DataFrame, DataFrame]: Tool and position metadata DataFrames, aligned row by row.
+    """
+    tool_df = tool_metadata_df.assign(
+        Case_Dir=[
+            get_case_dir(path, METALLICADOUR_DATA_PATH)
+            for path in tool_metadata_df.Filepath
+        ]
+    )
+    position_df = position_metadata_df.assign(
+        Case_Dir=[
+            get_case_dir(path, METALLICADOUR_POSITION_PATH)
+            for path in position_metadata_df.Filepath
+        ]
+    )
+    position_groups = dict(list(position_df.groupby("Case_Dir")))
+
+    tool_rows = []
+    position_rows = []
+    for case_dir, tool_group in tool_df.groupby("Case_Dir"):
+        if case_dir not in position_groups:
+            logger.warning(
+                f"No position file found for case {case_dir}. It is excluded."
+            )
+            continue
+        tool_group = tool_group.sort_values("Filepath")
+        position_group = position_groups.pop(case_dir).sort_values("Filepath")
+        if len(tool_group) != len(position_group):
+            logger.warning(
+                f"Case {case_dir} has {len(tool_group)} tool file(s) and {len(position_group)} "
+                f"position file(s). Only the first {min(len(tool_group), len(position_group))} pair(s) are kept."
+            )
+        num_pairs = min(len(tool_group), len(position_group))
+        tool_rows.append(tool_group.iloc[:num_pairs])
+        position_rows.append(position_group.iloc[:num_pairs])
+
+    for case_dir in position_groups:
+        logger.warning(f"No tool file found for case {case_dir}. It is excluded.")
+
+    if not tool_rows:
+        raise ValueError("No matching tool and position files found")
+
+    paired_tool_df = pd.concat(tool_rows, ignore_index=True).drop(columns="Case_Dir")
+    paired_position_df = pd.concat(position_rows, ignore_index=True).drop(
+        columns="Case_Dir"
+    )
+    return paired_tool_df, paired_position_df
+
+
+def resample_rows(values: ndarray, num_rows: int) -> ndarray:
+    """
+    Linearly resample a signal to a given number of rows, keeping the same time span.
+
+    Args:
+        values (ndarray): Signal of shape (rows, channels).
+        num_rows (int): Number of rows of the resampled signal.
+
+    Returns:
+        ndarray: Resampled signal of shape (num_rows, channels).
+    """
+    if values.shape[0] == num_rows:
+        return values
+    positions = np.linspace(0, values.shape[0] - 1, num_rows)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, values.shape[0] - 1)
+    weight = (positions - lower)[:, None]
+    return (1 - weight) * values[lower] + weight * values[upper]
+
+
+def load_drifts_paired_data(
+    tool_metadata_df: DataFrame,
+    position_metadata_df: DataFrame,
+    window_size: int = None,
+    stride: int = None,
+    align: str = "resample",
+    max_workers: int = None,
+    mp_context: BaseContext = None,
+) -> Tuple[ndarray, ...]:
+    """
+    Load the tool and position streams of the METALLICADOUR drifts in a single pass.
+
+    Tool CSV files and position XLSX files are paired by case directory and both streams
+    are read concurrently: the position XLSX files, whose parsing holds the GIL, are parsed
+    in a pool of processes while the tool CSV files are parsed one after another in the
+    current process.
+
+    The two streams are not sampled at the same rate and the files have no shared timestamp
+    column. With align="resample", each position file is linearly resampled to the number of
+    rows of its tool file, assuming both files cover the same recording, so that row i of both
+    streams refers to the same instant. With align="truncate", both streams are only truncated
+    to their common number of rows, which does not align them in time.
+
+    The pool is created before any thread is started by this function. With the "spawn" or
+    "forkserver" start methods (default on macOS and Windows), the calling script must be
+    protected by an `if __name__ == "__main__":` guard.
+
+    Args:
+        tool_metadata_df (DataFrame): Tool metadata from load_metallicadour_drifts_metadata.
+        position_metadata_df (DataFrame): Position metadata from load_metallicadour_drifts_metadata.
+        window_size (int, optional): If given, return a windowed joint tensor instead of
+            separate streams. Defaults to None.
+        stride (int, optional): Step between two windows. Defaults to window_size.
+        align (str, optional): 'resample' or 'truncate'. Defaults to 'resample'.
+        max_workers (int, optional): Number of processes parsing the position files. Defaults to None
+            (number of CPUs).
+        mp_context (BaseContext, optional): Multiprocessing context of the pool. Defaults to None
+            (default start method of the platform).
+
+    Returns:
+        tuple: If window_size is None:
+            - Array: tool data (n_files, rows, tool_channels).
+            - Array: position data (n_files, rows, position_channels).
+            - Array: corresponding labels.
+        Otherwise:
+            - Array: joint data (n_windows, window_size, tool_channels + position_channels).
+            - Array: corresponding labels.
+    """
+    if align not in ["resample", "truncate"]:
+        raise ValueError("align should be one of:  ['resample', 'truncate'] ")
+
+    tool_df, position_df = pair_drifts_metadata(tool_metadata_df, position_metadata_df)
+    num_cols = data_num_cols["metallicadour_drifts"]
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=mp_context
+    ) as executor:
+        # Submit the position files first so the workers are started before parsing the tool files
+        position_futures = submit_files(
+            executor,
+            position_df.Filepath.tolist(),
+            num_cols,
+            get_validated(position_df),
+            dtype=np.float64,
+        )
+        tool_arrays = read_files(
+            tool_df.Filepath.tolist(),
+            num_cols,
+            get_validated(tool_df),
+            dtype=np.float64,
+        )
+        position_arrays = [future.result() for future in position_futures]
+
+    mismatched = [
+        (tool.shape[0], position.shape[0])
+        for tool, position in zip(tool_arrays, position_arrays)
+        if tool.shape[0] != position.shape[0]
+    ]
+    if mismatched:
+        if align == "resample":
+            logger.info(
+                f"{len(mismatched)} position file(s) resampled to the number of rows of their tool file "
+                f"(e.g. {mismatched[0][1]} -> {mismatched[0][0]} rows)."
+            )
+            position_arrays = [
+                resample_rows(position, tool.shape[0])
+                for tool, position in zip(tool_arrays, position_arrays)
+            ]
+        else:
+            logger.warning(
+                f"{len(mismatched)} pair(s) have different numbers of tool and position rows "
+                f"(e.g. {mismatched[0][0]} and {mismatched[0][1]}). Both streams are truncated "
+                "to their common number of rows and are not aligned in time."
+            )
+
+    y = tool_df["class"].to_numpy()
+
+    # Make sure to have the same number of rows for both streams
+    min_rows = min(arr.shape[0] for arr in tool_arrays + position_arrays)
+    tool_data = stack_files([arr[:min_rows] for arr in tool_arrays])
+    position_data = stack_files([arr[:min_rows] for arr in position_arrays])
+
+    if window_size is None:
+        return tool_data, position_data, y
+
+    if stride is None:
+        stride = window_size
+    if window_size > min_rows:
+        raise ValueError(
+            f"window_size ({window_size}) is larger than the number of rows ({min_rows})"
+        )
+
+    joint_data = np.concatenate([tool_data, position_data], axis=2)
+    # (n_files, n_windows, channels, window_size) -> (n_files, n_windows, window_size, channels)
+    windows = np.lib.stride_tricks.sliding_window_view(joint_data, window_size, axis=1)[
+        :, ::stride
+    ].transpose(0, 1, 3, 2)
+    n_windows = windows.shape[1]
+    joint_data = windows.reshape(-1, window_size, joint_data.shape[2])
+    y = np.repeat(y, n_windows)
+
+    return joint_data, y
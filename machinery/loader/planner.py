@@ -0,0 +1,283 @@
+import os
+import shutil
+import tempfile
+from typing import List, Tuple
+
+import numpy as np
+from loguru import logger
+from pandas import DataFrame
+
+from machinery.loader.base import (
+    data_num_cols,
+    iter_data,
+    load_data,
+    validate_metadata,
+)
+
+# part of the available memory the loader is allowed to use
+memory_safety_factor = 0.8
+
+# load_csv_data keeps the parsed files and the stacked output in memory at the same time
+in_memory_peak_factor = 2
+
+# cgroup v1 reports an unlimited memory limit as a very large number
+cgroup_unlimited_threshold = 2**60
+
+# (limit, usage) files of the cgroup v2 and v1 memory controllers
+cgroup_memory_files = [
+    ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+    (
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+        "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+    ),
+]
+
+
+def get_available_memory() -> [int, None]:
+    """
+    Detect the memory available to the current process.
+
+    The container memory limit (cgroup v2 or v1) is taken into account when there is one.
+
+    Returns:
+        int: Available memory in bytes, or None if it cannot be detected.
+    """
+    available = None
+
+    try:
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+
+    if available is None:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            pass
+
+    for limit_path, usage_path in cgroup_memory_files:
+        try:
+            with open(limit_path, "r") as file:
+                limit = file.read().strip()
+            with open(usage_path, "r") as file:
+                usage = int(file.read().strip())
+        except (OSError, ValueError):
+            continue
+        if limit == "max" or int(limit) >= cgroup_unlimited_threshold:
+            continue
+        cgroup_available = max(int(limit) - usage, 0)
+        available = (
+            cgroup_available if available is None else min(available, cgroup_available)
+        )
+        break
+
+    return available
+
+
+def plan_loading(
+    metadata_df: DataFrame,
+    data_type: str,
+    memory_budget: int = None,
+    dtype: np.dtype = np.float64,
+    channels: List[int] = None,
+    memmap_dir: str = None,
+) -> dict:
+    """
+    Choose a loading strategy from the estimated size of the output, before any parsing.
+
+    The size is estimated from the header of the files (see validate_metadata).
+    The strategy is one of:
+        - "memory": the whole data is loaded in memory.
+        - "memmap": the data is written to a memory-mapped .npy file in memmap_dir.
+        - "stream": the data is yielded by batches of files.
+
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame containing file paths and class information.
+        data_type (str): Type of data ('laspi', 'ampere_rotor', 'ampere_stator', 'metallicadour_tool_wear').
+        memory_budget (int, optional): Memory budget in bytes. Defaults to None (detected).
+        dtype (np.dtype, optional): Data type of the output. Defaults to np.float64.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+        memmap_dir (str, optional): Directory of the memory-mapped file. Defaults to the temporary directory.
+
+    Returns:
+        dict: The loading plan, with the keys mode, reason, n_files, rows, n_channels, dtype,
+            estimated_bytes, peak_bytes, disk_peak_bytes, memory_budget, memmap_dir and batch_size. batch_size is the
+            number of files per batch in "stream" mode, derived from the memory budget, and None otherwise.
+    """
+    if data_type not in data_num_cols:
+        raise ValueError(f"data_type should be one of:  {list(data_num_cols)} ")
+
+    if "Estimated_Rows" not in metadata_df.columns:
+        metadata_df = validate_metadata(metadata_df, data_type)
+
+    n_files = len(metadata_df)
+    rows = int(metadata_df["Estimated_Rows"].min()) if n_files else 0
+    n_channels = data_num_cols[data_type] if channels is None else len(channels)
+    itemsize = np.dtype(dtype).itemsize
+
+    estimated_bytes = n_files * rows * n_channels * itemsize
+    peak_bytes = estimated_bytes * in_memory_peak_factor
+
+    # Each file is parsed whole before being truncated to the common number of rows
+    max_rows = int(metadata_df["Estimated_Rows"].max()) if n_files else 0
+    file_bytes = max_rows * data_num_cols[data_type] * itemsize
+
+    # load_csv_data sizes the memory-mapped file from the first file's rows, then rewrites it
+    # to a trimmed copy when a shorter file is found: both files exist at the same time on disk
+    disk_peak_bytes = n_files * max_rows * n_channels * itemsize + estimated_bytes
+
+    if memory_budget is None:
+        available = get_available_memory()
+        if available is not None:
+            memory_budget = int(available * memory_safety_factor)
+
+    if memmap_dir is None:
+        memmap_dir = tempfile.gettempdir()
+
+    batch_size = None
+    if memory_budget is None:
+        mode = "memory"
+        reason = "the available memory could not be detected"
+    elif peak_bytes <= memory_budget:
+        mode = "memory"
+        reason = f"the estimated peak ({format_bytes(peak_bytes)}) fits in the budget"
+    elif disk_peak_bytes <= shutil.disk_usage(memmap_dir).free:
+        mode = "memmap"
+        reason = (
+            f"the estimated peak ({format_bytes(peak_bytes)}) exceeds the budget, "
+            f"the estimated disk peak ({format_bytes(disk_peak_bytes)}) fits on disk in {memmap_dir}"
+        )
+    else:
+        mode = "stream"
+        batch_size = max(1, memory_budget // max(file_bytes * in_memory_peak_factor, 1))
+        reason = (
+            f"the estimated output ({format_bytes(estimated_bytes)}) fits neither "
+            f"in the budget nor on disk in {memmap_dir} "
+            f"(estimated disk peak {format_bytes(disk_peak_bytes)}), "
+        )
+        if file_bytes * in_memory_peak_factor > memory_budget:
+            reason += (
+                f"files are loaded one at a time but a single file "
+                f"({format_bytes(file_bytes)}) may already exceed the budget"
+            )
+            logger.warning(
+                f"A single file ({format_bytes(file_bytes)}) may exceed the memory budget "
+                f"({format_bytes(memory_budget)})."
+            )
+        else:
+            reason += f"batches of {batch_size} file(s) fit in the budget"
+
+    return {
+        "mode": mode,
+        "reason": reason,
+        "n_files": n_files,
+        "rows": rows,
+        "n_channels": n_channels,
+        "dtype": np.dtype(dtype).name,
+        "estimated_bytes": estimated_bytes,
+        "peak_bytes": peak_bytes,
+        "disk_peak_bytes": disk_peak_bytes,
+        "memory_budget": memory_budget,
+        "memmap_dir": memmap_dir,
+        "batch_size": batch_size,
+    }
+
+
+def format_bytes(num_bytes: [int, None]) -> str:
+    """
+    Format a number of bytes in a human readable way.
+
+    Args:
+        num_bytes (int): Number of bytes.
+
+    Returns:
+        str: Formatted size.
+    """
+    if num_bytes is None:
+        return "unknown"
+    size = float(num_bytes)
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if size < 1024 or unit == "TB":
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_plan(plan: dict) -> str:
+    """
+    Describe a loading plan returned by plan_loading.
+
+    Args:
+        plan (dict): The loading plan.
+
+    Returns:
+        str: Description of the plan.
+    """
+    return (
+        f"Loading mode '{plan['mode']}': {plan['reason']}. "
+        f"Output ({plan['n_files']}, ~{plan['rows']}, {plan['n_channels']}) {plan['dtype']}, "
+        f"estimated size {format_bytes(plan['estimated_bytes'])}, "
+        f"estimated peak {format_bytes(plan['peak_bytes'])}, "
+        f"memory budget {format_bytes(plan['memory_budget'])}."
+    )
+
+
+def load_data_auto(
+    metadata_df: DataFrame,
+    data_type: str,
+    memory_budget: int = None,
+    dtype: np.dtype = np.float64,
+    channels: List[int] = None,
+    memmap_dir: str = None,
+    batch_size: int = None,
+) -> Tuple[object, np.ndarray, dict]:
+    """
+    Load data with the strategy chosen by plan_loading.
+
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame containing file paths and class information.
+        data_type (str): Type of data ('laspi', 'ampere_rotor', 'ampere_stator', 'metallicadour_tool_wear').
+        memory_budget (int, optional): Memory budget in bytes. Defaults to None (detected).
+        dtype (np.dtype, optional): Data type of the output. Defaults to np.float64.
+        channels (List[int], optional): Indices of the columns to keep. Defaults to None (all columns).
+        memmap_dir (str, optional): Directory of the memory-mapped file. Defaults to the temporary directory.
+        batch_size (int, optional): Number of files per batch in "stream" mode. Defaults to None
+            (derived from the memory budget by plan_loading).
+
+    Returns:
+        tuple: A tuple containing:
+            - data: np.ndarray in "memory" mode, np.memmap in "memmap" mode,
+              or an iterator of (X, y) batches in "stream" mode.
+            - Array: corresponding labels.
+            - dict: the loading plan. In "memmap" mode, the key memmap_path gives the path of the
+              memory-mapped file, which is left to the caller to delete.
+    """
+    if "Estimated_Rows" not in metadata_df.columns:
+        metadata_df = validate_metadata(metadata_df, data_type)
+
+    plan = plan_loading(
+        metadata_df, data_type, memory_budget, dtype, channels, memmap_dir
+    )
+    logger.info(format_plan(plan))
+
+    y = metadata_df["class"].to_numpy()
+
+    if plan["mode"] == "stream":
+        if batch_size is not None:
+            plan["batch_size"] = batch_size
+        data = iter_data(metadata_df, data_type, plan["batch_size"], dtype, channels)
+        return data, y, plan
+
+    out_path = None
+    if plan["mode"] == "memmap":
+        fd, out_path = tempfile.mkstemp(
+            prefix=f"{data_type}_", suffix=".npy", dir=plan["memmap_dir"]
+        )
+        os.close(fd)
+        plan["memmap_path"] = out_path
+
+    data, y = load_data(metadata_df, data_type, dtype, channels, out_path)
+    return data, y, plan
@@ -0,0 +1,476 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+from loguru import logger
+from pandas import DataFrame
+
+from machinery.loader.base import load_data
+
+# folder of the cached features, next to the downloaded data (see download_data)
+spectral_cache_folder = os.path.join("data", "spectral_cache")
+
+accepted_transforms = ["stft", "spectrogram", "log_mel", "order"]
+
+
+def frame_signal(data: np.ndarray, n_fft: int, hop_length: int) -> np.ndarray:
+    """
+    Split the signals into overlapping frames without copying them.
+
+    Args:
+        data (np.ndarray): Data of shape (n_files, rows, channels).
+        n_fft (int): Frame length.
+        hop_length (int): Step between two frames.
+
+    Returns:
+        np.ndarray: Read-only view of shape (n_files, n_frames, channels, n_fft).
+    """
+    if data.shape[1] < n_fft:
+        raise ValueError(
+            f"n_fft ({n_fft}) is larger than the number of rows ({data.shape[1]})"
+        )
+    frames = np.lib.stride_tricks.sliding_window_view(data, n_fft, axis=1)
+    return frames[:, ::hop_length]
+
+
+def stft(
+    data: np.ndarray,
+    n_fft: int = 256,
+    hop_length: int = None,
+    chunk_size: int = 64,
+) -> np.ndarray:
+    """
+    Compute the short-time Fourier transform of all the files and channels at once.
+
+    Files are processed by chunks of chunk_size to bound the memory used by the frames.
+
+    Args:
+        data (np.ndarray): Data of shape (n_files, rows, channels), as returned by load_data.
+        n_fft (int, optional): Frame length. Defaults to 256.
+        hop_length (int, optional): Step between two frames. Defaults to n_fft // 4.
+        chunk_size (int, optional): Number of files per chunk. Defaults to 64.
+
+    Returns:
+        np.ndarray: Complex array of shape (n_files, n_frames, n_fft // 2 + 1, channels).
+    """
+    if hop_length is None:
+        hop_length = n_fft // 4
+    if hop_length < 1:
+        raise ValueError(f"hop_length must be at least 1, got {hop_length}")
+
+    n_files, rows, n_channels = data.shape
+    if rows < n_fft:
+        raise ValueError(f"n_fft ({n_fft}) is larger than the number of rows ({rows})")
+    window = np.hanning(n_fft)
+
+    n_frames = 1 + (rows - n_fft) // hop_length
+    result = np.empty(
+        (n_files, n_frames, n_fft // 2 + 1, n_channels), dtype=np.complex128
+    )
+
+    for start in range(0, n_files, chunk_size):
+        chunk = np.asarray(data[start : start + chunk_size], dtype=np.float64)
+        frames = frame_signal(chunk, n_fft, hop_length)
+        # (files, frames, channels, freqs) -> (files, frames, freqs, channels)
+        spectrum = np.fft.rfft(frames * window, axis=-1)
+        result[start : start + chunk_size] = spectrum.transpose(0, 1, 3, 2)
+
+    return result
+
+
+def spectrogram(
+    data: np.ndarray,
+    n_fft: int = 256,
+    hop_length: int = None,
+    power: float = 2.0,
+    chunk_size: int = 64,
+) -> np.ndarray:
+    """
+    Compute the magnitude spectrogram of all the files and channels at once.
+
+    Args:
+        data (np.ndarray): Data of shape (n_files, rows, channels).
+        n_fft (int, optional): Frame length. Defaults to 256.
+        hop_length (int, optional): Step between two frames. Defaults to n_fft // 4.
+        power (float, optional): Exponent of the magnitude (1 for amplitude, 2 for power). Defaults to 2.0.
+        chunk_size (int, optional): Number of files per chunk. Defaults to 64.
+
+    Returns:
+        np.ndarray: Array of shape (n_files, n_frames, n_fft // 2 + 1, channels).
+    """
+    result = None
+    for start in range(0, data.shape[0], chunk_size):
+        magnitude = np.abs(
+            stft(data[start : start + chunk_size], n_fft, hop_length, chunk_size)
+        )
+        if power != 1:
+            magnitude **= power
+        if result is None:
+            result = np.empty((data.shape[0],) + magnitude.shape[1:])
+        result[start : start + chunk_size] = magnitude
+    return result
+
+
+def mel_filterbank(
+    fs: float, n_fft: int, n_mels: int = 64, fmin: float = 0.0, fmax: float = None
+) -> np.ndarray:
+    """
+    Build a triangular mel filterbank.
+
+    Args:
+        fs (float): Sampling frequency in Hz.
+        n_fft (int): Frame length.
+        n_mels (int, optional): Number of mel bands. Defaults to 64.
+        fmin (float, optional): Lowest frequency in Hz. Defaults to 0.
+        fmax (float, optional): Highest frequency in Hz. Defaults to fs / 2.
+
+    Returns:
+        np.ndarray: Filterbank of shape (n_fft // 2 + 1, n_mels). Bands narrower than the FFT bin
+            spacing may contain no bin and stay empty, a warning is logged in that case.
+    """
+    if fmax is None:
+        fmax = fs / 2
+
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+    freqs = np.fft.rfftfreq(n_fft, d=1.0 / fs)
+    edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    lower, center, upper = edges[:-2], edges[1:-1], edges[2:]
+
+    rising = (freqs[:, None] - lower) / (center - lower)
+    falling = (upper - freqs[:, None]) / (upper - center)
+    filterbank = np.maximum(0.0, np.minimum(rising, falling))
+
+    # Bands narrower than the FFT bins may contain no bin at all and stay empty
+    empty_bands = int((filterbank.sum(axis=0) == 0).sum())
+    if empty_bands:
+        logger.warning(
+            f"{empty_bands} of the {n_mels} mel bands contain no FFT bin (n_fft={n_fft}, fs={fs}). "
+            "They are constant after the logarithm. Decrease n_mels or increase n_fft."
+        )
+    return filterbank
+
+
+def log_mel_spectrogram(
+    data: np.ndarray,
+    fs: float,
+    n_fft: int = 1024,
+    hop_length: int = None,
+    n_mels: int = 64,
+    fmin: float = 0.0,
+    fmax: float = None,
+    eps: float = 1e-10,
+    chunk_size: int = 64,
+) -> np.ndarray:
+    """
+    Compute the log-mel spectrogram of all the files and channels at once.
+
+    Args:
+        data (np.ndarray): Data of shape (n_files, rows, channels).
+        fs (float): Sampling frequency in Hz.
+        n_fft (int, optional): Frame length. Defaults to 1024, which leaves no empty mel band with
+            the default n_mels up to fs = 100 kHz.
+        hop_length (int, optional): Step between two frames. Defaults to n_fft // 4.
+        n_mels (int, optional): Number of mel bands. Defaults to 64.
+        fmin (float, optional): Lowest frequency in Hz. Defaults to 0.
+        fmax (float, optional): Highest frequency in Hz. Defaults to fs / 2.
+        eps (float, optional): Floor added before the logarithm. Defaults to 1e-10.
+        chunk_size (int, optional): Number of files per chunk. Defaults to 64.
+
+    Returns:
+        np.ndarray: Array of shape (n_files, n_frames, n_mels, channels) in dB.
+    """
+    filterbank = mel_filterbank(fs, n_fft, n_mels, fmin, fmax)
+    result = None
+    for start in range(0, data.shape[0], chunk_size):
+        power = spectrogram(
+            data[start : start + chunk_size], n_fft, hop_length, 2.0, chunk_size
+        )
+        mel = np.einsum("nfkc,km->nfmc", power, filterbank)
+        if result is None:
+            result = np.empty((data.shape[0],) + mel.shape[1:])
+        result[start : start + chunk_size] = 10.0 * np.log10(mel + eps)
+    return result
+
+
+def get_shaft_frequencies(metadata_df: DataFrame) -> np.ndarray:
+    """
+    Get the rotation frequency of each file from the metadata.
+
+    Args:
+        metadata_df (DataFrame): Metadata DataFrame with a Speed (rpm) or Speed_Frequency (Hz) column.
+
+    Returns:
+        np.ndarray: Rotation frequencies in Hz, one per file.
+    """
+    if "Speed" in metadata_df.columns:
+        return metadata_df["Speed"].to_numpy(dtype=np.float64) / 60.0
+    if "Speed_Frequency" in metadata_df.columns:
+        return metadata_df["Speed_Frequency"].to_numpy(dtype=np.float64)
+    raise ValueError(
+        "The metadata has no Speed or Speed_Frequency column to normalise the spectra"
+    )
+
+
+def order_spectrum(
+    data: np.ndarray,
+    shaft_frequencies: np.ndarray,
+    fs: float,
+    max_order: float = 20.0,
+    order_resolution: float = 0.05,
+    n_fft: int = 4096,
+    hop_length: int = None,
+    chunk_size: int = 64,
+) -> np.ndarray:
+    """
+    Compute speed-normalised order spectra of all the files and channels at once.
+
+    The power spectrum of each file is averaged over frames and resampled on a common
+    order grid (frequency / rotation frequency), so files recorded at different speeds
+    are comparable.
+
+    Args:
+        data (np.ndarray): Data of shape (n_files, rows, channels).
+        shaft_frequencies (np.ndarray): Rotation frequency of each file in Hz (see get_shaft_frequencies).
+        fs (float): Sampling frequency in Hz.
+        max_order (float, optional): Highest order of the grid. Defaults to 20.
+        order_resolution (float, optional): Step of the order grid. Defaults to 0.05.
+        n_fft (int, optional): Frame length. Defaults to 4096.
+        hop_length (int, optional): Step between two frames. Defaults to n_fft // 2.
+        chunk_size (int, optional): Number of files per chunk. Defaults to 64.
+
+    Returns:
+        np.ndarray: Array of shape (n_files, n_orders, channels). Orders above the Nyquist frequency
+            of a file (order * rotation frequency > fs / 2) are NaN.
+    """
+    shaft_frequencies = np.asarray(shaft_frequencies, dtype=np.float64)
+    if shaft_frequencies.shape != (data.shape[0],):
+        raise ValueError("shaft_frequencies must contain one value per file")
+    if hop_length is None:
+        hop_length = n_fft // 2
+
+    orders = np.arange(order_resolution, max_order + order_resolution, order_resolution)
+    bin_width = fs / n_fft
+    n_bins = n_fft // 2 + 1
+    result = np.empty((data.shape[0], len(orders), data.shape[2]))
+
+    for start in range(0, data.shape[0], chunk_size):
+        power = spectrogram(
+            data[start : start + chunk_size], n_fft, hop_length, 2.0, chunk_size
+        ).mean(axis=1)
+
+        # Fractional frequency bin of each order, for each file of the chunk
+        bins = orders[None, :] * shaft_frequencies[start : start + chunk_size, None]
+        bins = bins / bin_width
+        # Orders above the Nyquist frequency are not observable
+        above_nyquist = bins > n_bins - 1
+        bins = np.where(above_nyquist, 0, bins)
+        lower = np.floor(bins).astype(int)
+        upper = np.minimum(lower + 1, n_bins - 1)
+        weight = (bins - lower)[:, :, None]
+
+        power_lower = np.take_along_axis(power, lower[:, :, None], axis=1)
+        power_upper = np.take_along_axis(power, upper[:, :, None], axis=1)
+        chunk_result = (1 - weight) * power_lower + weight * power_upper
+        chunk_result[above_nyquist] = np.nan
+        result[start : start + chunk_size] = chunk_result
+
+    max_observable_order = fs / 2 / shaft_frequencies.max()
+    if len(orders) and orders[-1] > max_observable_order:
+        logger.warning(
+            f"Orders above {max_observable_order:.2f} exceed the Nyquist frequency for the fastest "
+            "file(s). They are set to NaN."
+        )
+
+    return result
+
+
+def transform_data(
+    data: np.ndarray,
+    transform: str,
+    fs: float = None,
+    shaft_frequencies: np.ndarray = None,
+    **kwargs,
+) -> np.ndarray:
+    """
+    Apply a spectral transform by name.
+
+    Args:
+        data (np.ndarray): Data of shape (n_files, rows, channels).
+        transform (str): One of 'stft', 'spectrogram', 'log_mel', 'order'.
+        fs (float, optional): Sampling frequency in Hz, required by 'log_mel' and 'order'.
+        shaft_frequencies (np.ndarray, optional): Rotation frequency of each file, required by 'order'.
+        **kwargs: Parameters of the transform.
+
+    Returns:
+        np.ndarray: Transformed data.
+    """
+    if transform not in accepted_transforms:
+        raise ValueError(f"transform should be one of:  {accepted_transforms} ")
+    if transform in ["log_mel", "order"] and fs is None:
+        raise ValueError(f"fs is required by the '{transform}' transform")
+
+    if transform == "stft":
+        return stft(data, **kwargs)
+    if transform == "spectrogram":
+        return spectrogram(data, **kwargs)
+    if transform == "log_mel":
+        return log_mel_spectrogram(data, fs, **kwargs)
+    if shaft_frequencies is None:
+        raise ValueError("shaft_frequencies is required by the 'order' transform")
+    return order_spectrum(data, shaft_frequencies, fs, **kwargs)
+
+
+def transform_batches(
+    batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+    transform: str,
+    fs: float = None,
+    metadata_df: DataFrame = None,
+    **kwargs,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Apply a spectral transform to streamed batches, such as the ones yielded by iter_data.
+
+    Args:
+        batches (Iterable[Tuple[np.ndarray, np.ndarray]]): Batches of (X, y).
+        transform (str): One of 'stft', 'spectrogram', 'log_mel', 'order'.
+        fs (float, optional): Sampling frequency in Hz, required by 'log_mel' and 'order'.
+        metadata_df (DataFrame, optional): Metadata of the streamed files, in the same order,
+            required by 'order'.
+        **kwargs: Parameters of the transform.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: Transformed batch and the corresponding labels.
+    """
+    shaft_frequencies = None
+    if transform == "order":
+        if metadata_df is None:
+            raise ValueError("metadata_df is required by the 'order' transform")
+        shaft_frequencies = get_shaft_frequencies(metadata_df)
+
+    start = 0
+    for X, y in batches:
+        batch_frequencies = None
+        if shaft_frequencies is not None:
+            batch_frequencies = shaft_frequencies[start : start + len(X)]
+        start += len(X)
+        yield transform_data(X, transform, fs, batch_frequencies, **kwargs), y
+
+
+def get_cache_path(
+    metadata_df: DataFrame,
+    data_type: str,
+    transform: str,
+    cache_dir: str,
+    params: dict,
+) -> str:
+    """
+    Get the path of the cached features of a metadata DataFrame.
+
+    The name depends on the files, their modification time and the transform parameters.
+
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame containing file paths.
+        data_type (str): Type of data.
+        transform (str): Name of the transform.
+        cache_dir (str): Directory of the cached features.
+        params (dict): Parameters of the transform.
+
+    Returns:
+        str: Path of the .npy file.
+    """
+    files = [
+        [os.path.abspath(path), os.stat(path).st_mtime_ns]
+        for path in metadata_df.Filepath
+    ]
+    description = json.dumps(
+        {
+            "data_type": data_type,
+            "transform": transform,
+            "params": params,
+            "files": files,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    digest = hashlib.sha1(description.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{data_type}_{transform}_{digest}.npy")
+
+
+def load_spectral_data(
+    metadata_df: DataFrame,
+    data_type: str,
+    transform: str = "log_mel",
+    fs: float = None,
+    cache_dir: str = None,
+    use_cache: bool = True,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load data from the metadata DataFrame and apply a spectral transform, with a disk cache.
+
+    If the features were already computed for the same files and parameters, they are read
+    from cache_dir and the raw files are not parsed.
+
+    Args:
+        metadata_df (DataFrame): The metadata DataFrame containing file paths and class information.
+        data_type (str): Type of data ('laspi', 'ampere_rotor', 'ampere_stator', 'metallicadour_tool_wear').
+        transform (str, optional): One of 'stft', 'spectrogram', 'log_mel', 'order'. Defaults to 'log_mel'.
+        fs (float, optional): Sampling frequency in Hz, required by 'log_mel' and 'order'.
+        cache_dir (str, optional): Directory of the cached features. Defaults to data/spectral_cache
+            in the current directory.
+        use_cache (bool, optional): Whether to read and write the cached features. Defaults to True.
+        **kwargs: Parameters of the transform.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: A tuple containing the features (X) and the labels (y).
+    """
+    if transform not in accepted_transforms:
+        raise ValueError(f"transform should be one of:  {accepted_transforms} ")
+
+    y = metadata_df["class"].to_numpy()
+
+    shaft_frequencies = None
+    if transform == "order":
+        shaft_frequencies = get_shaft_frequencies(metadata_df)
+
+    cache_path = None
+    if use_cache:
+        if cache_dir is None:
+            cache_dir = os.path.join(os.getcwd(), spectral_cache_folder)
+        # chunk_size does not change the features
+        params = {key: value for key, value in kwargs.items() if key != "chunk_size"}
+        params["fs"] = fs
+        if shaft_frequencies is not None:
+            # The speeds of the metadata normalise the order spectra
+            params["shaft_frequencies"] = shaft_frequencies.tolist()
+        cache_path = get_cache_path(
+            metadata_df, data_type, transform, cache_dir, params
+        )
+        if os.path.exists(cache_path):
+            logger.info(f"Loading cached {transform} features from {cache_path}.")
+            return np.load(cache_path), y
+
+    data, y = load_data(metadata_df, data_type, dtype=np.float64)
+    features = transform_data(data, transform, fs, shaft_frequencies, **kwargs)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a unique temporary file first so an interrupted or concurrent save is never read back
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.save(file, features)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    return features, y